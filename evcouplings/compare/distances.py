@@ -6,6 +6,8 @@ Authors:
   Anna G. Green (remap_complex_chains)
 """
 
+import os
+from os import path
 from collections import Counter
 from itertools import combinations
 from operator import itemgetter
@@ -13,15 +15,163 @@ from copy import deepcopy
 
 import numpy as np
 import pandas as pd
-from numba import jit
+from numba import cuda, jit, prange
+from scipy.spatial.distance import cdist
 
 from evcouplings.compare.pdb import load_structures
 from evcouplings.utils.constants import AA1_to_AA3
-from evcouplings.utils.system import create_prefix_folders
+from evcouplings.utils.system import (
+    create_prefix_folders, ResourceError
+)
 
 
-@jit(nopython=True)
-def _distances(residues_i, coords_i, residues_j, coords_j, symmetric):
+# number of residues along each axis of the tiles that
+# the distance matrix is split into for computation
+TILE_SIZE = 32
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _sq_dist(x_i, y_i, z_i, coords_j, a_j):
+    """
+    Compute squared Euclidean distance between an atom
+    and atom a_j in coords_j (written out explicitly to
+    avoid temporary arrays)
+
+    Parameters
+    ----------
+    x_i : float
+        x coordinate of first atom
+    y_i : float
+        y coordinate of first atom
+    z_i : float
+        z coordinate of first atom
+    coords_j : np.array
+        3 x N_a matrix containing 3D coordinates of all atoms
+    a_j : int
+        Index of second atom in coords_j
+
+    Returns
+    -------
+    float
+        Squared atom distance
+    """
+    dx = x_i - coords_j[0, a_j]
+    dy = y_i - coords_j[1, a_j]
+    dz = z_i - coords_j[2, a_j]
+
+    return dx * dx + dy * dy + dz * dz
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _min_atom_dist(range_i, coords_i, range_j, coords_j):
+    """
+    Compute minimum squared distance between the atoms
+    of two residues (inner kernel of _distances() and
+    _distances_symmetric())
+
+    Parameters
+    ----------
+    range_i : np.array
+        Index of first atom and number of atoms
+        of the first residue in coords_i
+    coords_i : np.array
+        3 x N_a matrix containing 3D coordinates of all atoms
+    range_j : np.array
+        Like range_i, but for second residue
+    coords_j : np.array
+        Like coords_i, but for second residue
+
+    Returns
+    -------
+    float
+        Minimum squared atom distance
+    """
+    # keep four independent running minima ("lanes") over the
+    # atoms of residue j, so consecutive atom pairs do not depend
+    # on each other and can be processed in parallel by the CPU
+    min_0 = np.float32(1e12)
+    min_1 = min_0
+    min_2 = min_0
+    min_3 = min_0
+
+    # atoms of each residue are stored contiguously
+    # starting at first atom index
+    first_i = range_i[0]
+    end_i = first_i + range_i[1]
+    first_j = range_j[0]
+    end_j = first_j + range_j[1]
+    end_lanes = end_j - range_j[1] % 4
+
+    # iterate all pairs of atoms for residue pair.
+    # Since square root is monotonic, minimize squared
+    # distance and take root only once at the end
+    for a_i in range(first_i, end_i):
+        # load coordinates of atom i only once
+        # for all atoms of residue j
+        x_i = coords_i[0, a_i]
+        y_i = coords_i[1, a_i]
+        z_i = coords_i[2, a_i]
+
+        # update each lane with one of four consecutive atoms
+        # (select rather than min() call, so the loop compiles
+        # without branches)
+        for a_j in range(first_j, end_lanes, 4):
+            cur = _sq_dist(x_i, y_i, z_i, coords_j, a_j)
+            min_0 = cur if cur < min_0 else min_0
+            cur = _sq_dist(x_i, y_i, z_i, coords_j, a_j + 1)
+            min_1 = cur if cur < min_1 else min_1
+            cur = _sq_dist(x_i, y_i, z_i, coords_j, a_j + 2)
+            min_2 = cur if cur < min_2 else min_2
+            cur = _sq_dist(x_i, y_i, z_i, coords_j, a_j + 3)
+            min_3 = cur if cur < min_3 else min_3
+
+        # remaining atoms if number of atoms is not multiple of 4
+        for a_j in range(end_lanes, end_j):
+            cur = _sq_dist(x_i, y_i, z_i, coords_j, a_j)
+            min_0 = cur if cur < min_0 else min_0
+
+    # reduce lanes to overall minimum
+    min_0 = min_1 if min_1 < min_0 else min_0
+    min_2 = min_3 if min_3 < min_2 else min_2
+
+    return min_2 if min_2 < min_0 else min_0
+
+
+@jit(nopython=True, cache=True)
+def _min_centroid_dist(centroid_i, radius_i, centroid_j, radius_j):
+    """
+    Compute lower bound of minimum atom distance between
+    two residues from their centroids and radii
+
+    Parameters
+    ----------
+    centroid_i : np.array
+        Mean 3D coordinates of atoms of first residue
+    radius_i : float
+        Maximum distance of any atom of first
+        residue to its centroid
+    centroid_j : np.array
+        Like centroid_i, but for second residue
+    radius_j : float
+        Like radius_i, but for second residue
+
+    Returns
+    -------
+    float
+        Lower bound of minimum atom distance
+        (may be negative)
+    """
+    dx = centroid_i[0] - centroid_j[0]
+    dy = centroid_i[1] - centroid_j[1]
+    dz = centroid_i[2] - centroid_j[2]
+
+    return np.sqrt(dx * dx + dy * dy + dz * dz) - radius_i - radius_j
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _distances(residues_i, coords_i, centroids_i, radii_i,
+               residues_j, coords_j, centroids_j, radii_j,
+               max_dist):
     """
     Compute minimum atom distances between residues. If used on
     a single atom per residue, this function can e.g. also compute
@@ -30,18 +180,202 @@ def _distances(residues_i, coords_i, residues_j, coords_j, symmetric):
     Parameters
     ----------
     residues_i : np.array
-        Matrix of size N_i x 2, where N_i = number of residues
-        in PDB chain used for first axis. Each row of this
-        matrix contains the first and last (inclusive) index
-        of the atoms comprising this residue in the coords_i
-        matrix
+        Matrix of size N_i x 2 (int32), where N_i = number of
+        residues in PDB chain used for first axis. Each row of
+        this matrix contains the index of the first atom and the
+        number of atoms of this residue in the coords_i matrix
+        (atoms of each residue have to be contiguous)
     coords_i : np.array
-        N_a x 3 matrix containing 3D coordinates of all atoms
-        (where N_a is total number of atoms in chain)
+        3 x N_a matrix (float32) containing 3D coordinates of
+        all atoms (where N_a is total number of atoms in chain),
+        with x, y and z coordinates stored in separate rows
+        (structure-of-arrays layout)
+    centroids_i : np.array
+        N_i x 3 matrix containing the mean atom
+        coordinates of each residue
+    radii_i : np.array
+        Vector of length N_i containing the maximum distance
+        of any atom of a residue to its centroid
     residues_j : np.array
         Like residues_i, but for chain used on second axis
     coords_j : np.array
-        Like coords_j, but for chain used on second axis
+        Like coords_i, but for chain used on second axis
+    centroids_j : np.array
+        Like centroids_i, but for chain used on second axis
+    radii_j : np.array
+        Like radii_i, but for chain used on second axis
+    max_dist : float
+        Skip computation of atom distances for residue pairs
+        that are guaranteed to be further apart than max_dist
+        (based on their centroids and radii), and set their
+        entry to np.inf instead. Use np.inf to compute all pairs.
+
+    Returns
+    -------
+    dists : np.array
+        Matrix of size N_i x N_j containing squared minimum
+        atom distance between residue i and j in dists[i, j]
+    """
+    N_i, _ = residues_i.shape
+    N_j, _ = residues_j.shape
+
+    # matrix to hold final distances
+    dists = np.zeros((N_i, N_j), dtype=np.float32)
+
+    # split matrix into tiles of TILE_SIZE x TILE_SIZE residues,
+    # so atoms of a tile's residues stay in cache while all its
+    # pairs are computed; tiles are distributed across threads
+    T = TILE_SIZE
+    tiles_i = (N_i + T - 1) // T
+    tiles_j = (N_j + T - 1) // T
+
+    for t in prange(tiles_i * tiles_j):
+        start_i = (t // tiles_j) * T
+        start_j = (t % tiles_j) * T
+
+        for i in range(start_i, min(start_i + T, N_i)):
+            for j in range(start_j, min(start_j + T, N_j)):
+                if _min_centroid_dist(
+                    centroids_i[i], radii_i[i], centroids_j[j], radii_j[j]
+                ) > max_dist:
+                    dists[i, j] = np.inf
+                else:
+                    dists[i, j] = _min_atom_dist(
+                        residues_i[i], coords_i, residues_j[j], coords_j
+                    )
+
+    return dists
+
+
+@jit(nopython=True, parallel=True, cache=True)
+def _distances_symmetric(residues, coords, centroids, radii, max_dist):
+    """
+    Compute minimum atom distances between all residues
+    of a single chain (symmetric version of _distances()).
+    Only fills the upper triangle of the distance matrix,
+    the lower triangle has to be filled in by the caller
+    (e.g. by adding the transpose).
+
+    Parameters
+    ----------
+    residues : np.array
+        See residues_i in _distances()
+    coords : np.array
+        See coords_i in _distances()
+    centroids : np.array
+        See centroids_i in _distances()
+    radii : np.array
+        See radii_i in _distances()
+    max_dist : float
+        See _distances()
+
+    Returns
+    -------
+    dists : np.array
+        Matrix of size N x N containing squared minimum atom
+        distance between residue i and j in dists[i, j] for i < j.
+        Diagonal and lower triangle are zero.
+    """
+    N, _ = residues.shape
+
+    # matrix to hold final distances (diagonal remains
+    # zero, since any residue has distance 0 to itself)
+    dists = np.zeros((N, N), dtype=np.float32)
+
+    # split matrix into tiles (cf. _distances()), and
+    # only enumerate tiles on or above the diagonal
+    T = TILE_SIZE
+    num_tiles = (N + T - 1) // T
+    tiles = np.empty((num_tiles * (num_tiles + 1) // 2, 2), dtype=np.int64)
+    k = 0
+    for tile_i in range(num_tiles):
+        for tile_j in range(tile_i, num_tiles):
+            tiles[k, 0] = tile_i * T
+            tiles[k, 1] = tile_j * T
+            k += 1
+
+    # compute upper triangle of matrix in parallel
+    for t in prange(tiles.shape[0]):
+        start_i = tiles[t, 0]
+        start_j = tiles[t, 1]
+
+        for i in range(start_i, min(start_i + T, N)):
+            for j in range(max(start_j, i + 1), min(start_j + T, N)):
+                if _min_centroid_dist(
+                    centroids[i], radii[i], centroids[j], radii[j]
+                ) > max_dist:
+                    dists[i, j] = np.inf
+                else:
+                    dists[i, j] = _min_atom_dist(
+                        residues[i], coords, residues[j], coords
+                    )
+
+    return dists
+
+
+# upper limit for size of intermediate atom-pair arrays created
+# per block in _distances_vectorized() and _distances_cdist()
+# (in bytes); small enough blocks remain in cache and run
+# considerably faster than a single huge array
+MAX_BLOCK_BYTES = 2 ** 24
+
+
+def _extract_padded_coords(residues, coords, fill_value=np.inf):
+    """
+    Rearrange atom coordinates into padded array
+    with fixed number of atoms per residue
+
+    Parameters
+    ----------
+    residues : np.array
+        Matrix of size N x 2 containing first atom index
+        and number of atoms of each residue in coords
+        (cf. _distances())
+    coords : np.array
+        3 x N_a matrix containing 3D coordinates of all atoms
+    fill_value : float, optional (default: np.inf)
+        Coordinate value used for unused atom slots
+
+    Returns
+    -------
+    padded : np.array
+        Array of size 3 x N x A_max (float32), where A_max
+        is the maximum number of atoms in any residue.
+        Atom slots beyond the number of atoms of a
+        residue are set to fill_value.
+    """
+    counts = residues[:, 1]
+    N = len(counts)
+    A_max = counts.max() if N > 0 else 0
+
+    padded = np.full((3, N, A_max), fill_value, dtype=np.float32)
+
+    # fill in atoms residue by residue
+    for i, (first, count) in enumerate(residues):
+        padded[:, i, :count] = coords[:, first:first + count]
+
+    return padded
+
+
+def _distances_vectorized(residues_i, coords_i, residues_j, coords_j):
+    """
+    Compute minimum atom distances between residues
+    using vectorized numpy operations on padded
+    coordinate arrays. Gives the same distances as
+    from_coords() with jit-compiled _distances() (which
+    itself returns squared distances), without requiring
+    jit compilation.
+
+    Parameters
+    ----------
+    residues_i : np.array
+        See _distances()
+    coords_i : np.array
+        See _distances()
+    residues_j : np.array
+        See _distances()
+    coords_j : np.array
+        See _distances()
 
     Returns
     -------
@@ -49,42 +383,220 @@ def _distances(residues_i, coords_i, residues_j, coords_j, symmetric):
         Matrix of size N_i x N_j containing minimum atom
         distance between residue i and j in dists[i, j]
     """
-    LARGE_DIST = 1000000
+    # pad with opposite infinities on both axes, so that the
+    # difference between two unused slots becomes inf rather
+    # than nan (inf - inf)
+    A_i = _extract_padded_coords(residues_i, coords_i, np.inf)
+    A_j = _extract_padded_coords(residues_j, coords_j, -np.inf)
+
+    _, N_i, A_max_i = A_i.shape
+    _, N_j, A_max_j = A_j.shape
+
+    dists = np.zeros((N_i, N_j), dtype=np.float32)
+    if N_i == 0 or N_j == 0:
+        return dists
+
+    # x, y and z coordinates of second axis shaped
+    # so they broadcast against blocks of first axis
+    xyz_j = A_j[:, None, :, None, :]
+
+    # compute in blocks along first axis to limit memory
+    # of intermediate N_block x N_j x A_max_i x A_max_j arrays
+    row_bytes = N_j * A_max_i * A_max_j * A_i.itemsize
+    block_size = int(max(1, MAX_BLOCK_BYTES // max(row_bytes, 1)))
+
+    for start in range(0, N_i, block_size):
+        block = A_i[:, start:start + block_size, None, :, None]
+
+        # squared distances of all atom pairs in block, accumulated
+        # in place one coordinate axis at a time
+        sq_dists = block[0] - xyz_j[0]
+        sq_dists *= sq_dists
+        for k in (1, 2):
+            diff = block[k] - xyz_j[k]
+            diff *= diff
+            sq_dists += diff
+
+        # minimum over all atom pairs of each residue pair;
+        # only take square root of final minimum
+        dists[start:start + block_size] = sq_dists.reshape(
+            sq_dists.shape[0], N_j, -1
+        ).min(axis=-1)
+
+    return np.sqrt(dists)
+
+
+def _distances_cdist(residues_i, coords_i, residues_j, coords_j):
+    """
+    Compute minimum atom distances between residues by
+    computing all atom-atom distances at once using
+    scipy's cdist, followed by reduction to the minimum
+    over the atoms of each residue pair. Gives the same
+    distances as from_coords() with jit-compiled
+    _distances() (which itself returns squared distances),
+    without requiring jit compilation.
+
+    Parameters
+    ----------
+    residues_i : np.array
+        See _distances()
+    coords_i : np.array
+        See _distances()
+    residues_j : np.array
+        See _distances()
+    coords_j : np.array
+        See _distances()
 
+    Returns
+    -------
+    dists : np.array
+        Matrix of size N_i x N_j containing minimum atom
+        distance between residue i and j in dists[i, j]
+    """
     N_i, _ = residues_i.shape
     N_j, _ = residues_j.shape
 
-    # matrix to hold final distances
-    dists = np.zeros((N_i, N_j))
-
-    # iterate all pairs of residues
-    for i in range(N_i):
-        for j in range(N_j):
-            # limit computation in symmetric case and
-            # use previously calculated distance
-            if symmetric and i >= j:
-                dists[i, j] = dists[j, i]
-            else:
-                range_i = residues_i[i]
-                range_j = residues_j[j]
-                min_dist = LARGE_DIST
-
-                # iterate all pairs of atoms for residue pair;
-                # end of coord range is inclusive, so have to add 1
-                for a_i in range(range_i[0], range_i[1] + 1):
-                    for a_j in range(range_j[0], range_j[1] + 1):
-                        # compute Euclidean distance between atom pair
-                        cur_dist = np.sqrt(
-                            np.sum(
-                                (coords_i[a_i] - coords_j[a_j]) ** 2
-                            )
-                        )
-                        # store if this is a smaller distance
-                        min_dist = min(min_dist, cur_dist)
-
-                dists[i, j] = min_dist
+    dists = np.zeros((N_i, N_j), dtype=np.float32)
+    if N_i == 0 or N_j == 0:
+        return dists
+
+    # maximum number of atoms on first axis per block so that
+    # atom distance matrix (float64) stays below memory limit
+    _, N_a_j = coords_j.shape
+    max_atoms = max(1, MAX_BLOCK_BYTES // (8 * N_a_j))
+
+    # index after last atom of each residue
+    ends_i = residues_i[:, 0] + residues_i[:, 1]
+
+    start = 0
+    while start < N_i:
+        # select block of residues on first axis with limited
+        # total number of atoms (but at least one residue)
+        first_atom = residues_i[start, 0]
+        end = max(
+            start + 1,
+            np.searchsorted(ends_i, first_atom + max_atoms, side="right")
+        )
 
-    return dists
+        # squared distances between all atom pairs in block
+        sq_dists = cdist(
+            coords_i[:, first_atom:ends_i[end - 1]].T,
+            coords_j.T,
+            "sqeuclidean"
+        )
+
+        # reduce to minimum over atoms of each residue along
+        # both axes (atoms of each residue are contiguous, so
+        # only first atom index is needed)
+        sq_dists = np.minimum.reduceat(
+            sq_dists, residues_i[start:end, 0] - first_atom, axis=0
+        )
+        dists[start:end] = np.minimum.reduceat(
+            sq_dists, residues_j[:, 0], axis=1
+        )
+
+        start = end
+
+    return np.sqrt(dists)
+
+
+# minimum number of residue pairs for which distances will
+# be computed on the GPU when requested; below, data transfer
+# and kernel launch overhead outweigh the gain over the CPU
+MIN_GPU_PAIRS = 250000
+
+# number of threads along each axis of a CUDA thread block
+GPU_BLOCK_SIZE = 16
+
+
+@cuda.jit
+def _distances_cuda(residues_i, coords_i, residues_j, coords_j, dists):
+    """
+    CUDA kernel computing squared minimum atom distances
+    between residues, one residue pair per GPU thread.
+
+    Parameters
+    ----------
+    residues_i : numba.cuda.devicearray
+        See _distances()
+    coords_i : numba.cuda.devicearray
+        See _distances()
+    residues_j : numba.cuda.devicearray
+        See _distances()
+    coords_j : numba.cuda.devicearray
+        See _distances()
+    dists : numba.cuda.devicearray
+        N_i x N_j matrix (float32) that will be filled
+        with squared minimum atom distances
+    """
+    i, j = cuda.grid(2)
+
+    if i < dists.shape[0] and j < dists.shape[1]:
+        first_i = residues_i[i, 0]
+        first_j = residues_j[j, 0]
+        end_j = first_j + residues_j[j, 1]
+        min_dist = np.float32(1e12)
+
+        for a_i in range(first_i, first_i + residues_i[i, 1]):
+            x_i = coords_i[0, a_i]
+            y_i = coords_i[1, a_i]
+            z_i = coords_i[2, a_i]
+
+            for a_j in range(first_j, end_j):
+                dx = x_i - coords_j[0, a_j]
+                dy = y_i - coords_j[1, a_j]
+                dz = z_i - coords_j[2, a_j]
+                cur_dist = dx * dx + dy * dy + dz * dz
+                min_dist = cur_dist if cur_dist < min_dist else min_dist
+
+        dists[i, j] = min_dist
+
+
+def _distances_gpu(residues_i, coords_i, residues_j, coords_j):
+    """
+    Compute minimum atom distances between residues
+    on a CUDA GPU. Unlike _distances(), returns the
+    distances themselves rather than squared distances.
+
+    Parameters
+    ----------
+    residues_i : np.array
+        See _distances()
+    coords_i : np.array
+        See _distances()
+    residues_j : np.array
+        See _distances()
+    coords_j : np.array
+        See _distances()
+
+    Returns
+    -------
+    dists : np.array
+        Matrix of size N_i x N_j containing minimum atom
+        distance between residue i and j in dists[i, j]
+    """
+    N_i, _ = residues_i.shape
+    N_j, _ = residues_j.shape
+
+    if N_i == 0 or N_j == 0:
+        return np.zeros((N_i, N_j), dtype=np.float32)
+
+    dists = cuda.device_array((N_i, N_j), dtype=np.float32)
+
+    # one thread per residue pair
+    threads = (GPU_BLOCK_SIZE, GPU_BLOCK_SIZE)
+    blocks = (
+        (N_i + GPU_BLOCK_SIZE - 1) // GPU_BLOCK_SIZE,
+        (N_j + GPU_BLOCK_SIZE - 1) // GPU_BLOCK_SIZE,
+    )
+
+    _distances_cuda[blocks, threads](
+        cuda.to_device(residues_i), cuda.to_device(coords_i),
+        cuda.to_device(residues_j), cuda.to_device(coords_j),
+        dists
+    )
+
+    return np.sqrt(dists.copy_to_host())
 
 
 class DistanceMap:
@@ -109,6 +621,12 @@ class DistanceMap:
             (of size len(residues_i) x len(residues_j))
         symmetric : bool
             Indicates if distance matrix is symmetric
+
+        Raises
+        ------
+        ValueError
+            If residue identifiers on either axis
+            are not unique
         """
         self.residues_i = residues_i
         self.residues_j = residues_j
@@ -116,13 +634,22 @@ class DistanceMap:
         self.symmetric = symmetric
 
         # create mappings from identifier to entry in distance matrix
-        self.id_map_i = {
-            id_: i for (i, id_) in enumerate(self.residues_i.id.values)
-        }
-
-        self.id_map_j = {
-            id_: j for (j, id_) in enumerate(self.residues_j.id.values)
-        }
+        # (hash-based index, which allows vectorized lookups)
+        self.id_map_i = pd.Index(self.residues_i.id.astype(str).values)
+        self.id_map_j = pd.Index(self.residues_j.id.astype(str).values)
+
+        # lookup of distances by identifier is only
+        # well-defined if each identifier occurs once
+        for axis, id_map in zip(
+            ("first", "second"), (self.id_map_i, self.id_map_j)
+        ):
+            if not id_map.is_unique:
+                raise ValueError(
+                    "Residue identifiers on {} axis of distance map "
+                    "are not unique: {}".format(
+                        axis, ", ".join(id_map[id_map.duplicated()].unique())
+                    )
+                )
 
     @classmethod
     def _extract_coords(cls, coords):
@@ -139,41 +666,67 @@ class DistanceMap:
         Returns
         -------
         atom_ranges : np.array
-            Matrix of size N_i x 2, where N_i = number
+            Matrix of size N_i x 2 (int32), where N_i = number
             of residues in PDB chain. Each row of this matrix
-            contains the first and last (inclusive) index of
-            the atoms comprising this residue in the xyz_coords
-            matrix
+            contains the index of the first atom and the number
+            of atoms of this residue in the xyz_coords matrix
         xyz_coords : np.array
-            N_a x 3 matrix containing 3D coordinates
-            of all atoms (where N_a is total number of
-            atoms in chain)
+            3 x N_a matrix (float32) containing x, y and z
+            coordinates of all atoms in separate rows (where
+            N_a is total number of atoms in chain)
+        centroids : np.array
+            N_i x 3 matrix containing the mean coordinates
+            of the atoms of each residue
+        radii : np.array
+            Vector of length N_i containing the maximum
+            distance of any atom of a residue to its centroid
         """
-        # First, reset index and drop because indices might
-        # be discontinuous after removal of atoms (we need that
-        # indices correspond to boundaries of each residue in
-        # raw numpy array).
-        # Second, move index into column,
-        # so we can access values after groupby
-        C = coords.reset_index(drop=True).reset_index()
-
-        # matrix of 3D coordinates
-        xyz_coords = np.stack(
-            (C.x.values, C.y.values, C.z.values)
-        ).T
-
-        # extract what the first and last atom index
-        # of each residue is
-        C_grp = C.groupby("residue_index")
-        atom_ranges = np.stack(
-            (C_grp.first().loc[:, "index"].values,
-             C_grp.last().loc[:, "index"].values)
-        ).T
-
-        return atom_ranges, xyz_coords
+        residue_index = coords.residue_index.values
+
+        # matrix of 3D coordinates, with x, y and z in separate
+        # contiguous rows for efficient access in distance
+        # calculation; single precision is sufficient for PDB
+        # coordinates and halves the memory traffic
+        xyz_coords = np.ascontiguousarray(
+            coords.loc[:, ["x", "y", "z"]].values.T, dtype=np.float32
+        )
+
+        # atoms of each residue have to be stored contiguously
+        # in the coordinate matrix, so make sure they are sorted
+        # by residue (keeping order of atoms within residue)
+        if np.any(residue_index[1:] < residue_index[:-1]):
+            order = np.argsort(residue_index, kind="mergesort")
+            residue_index = residue_index[order]
+            xyz_coords = xyz_coords[:, order]
+
+        # find first atom of each residue as positions where
+        # residue index changes (no groupby required since atoms
+        # are sorted), and derive number of atoms from that
+        is_first = np.ones(len(residue_index), dtype=bool)
+        is_first[1:] = residue_index[1:] != residue_index[:-1]
+        offsets = np.flatnonzero(is_first)
+        counts = np.diff(np.append(offsets, len(residue_index)))
+        atom_ranges = np.stack((offsets, counts)).T.astype(np.int32)
+
+        # compute center of each residue, and maximum
+        # distance of any of its atoms from this center
+        centroids = np.add.reduceat(
+            xyz_coords, atom_ranges[:, 0], axis=1, dtype=np.float64
+        ).T / counts[:, np.newaxis]
+
+        centroid_dists = np.sqrt(
+            np.sum(
+                (xyz_coords.T - np.repeat(centroids, counts, axis=0)) ** 2,
+                axis=1
+            )
+        )
+        radii = np.maximum.reduceat(centroid_dists, atom_ranges[:, 0])
+
+        return atom_ranges, xyz_coords, centroids, radii
 
     @classmethod
-    def from_coords(cls, chain_i, chain_j=None):
+    def from_coords(cls, chain_i, chain_j=None, method="numba",
+                    max_dist=None, device="cpu"):
         """
         Compute distance matrix from PDB chain
         coordinates.
@@ -186,14 +739,74 @@ class DistanceMap:
             PDB chain to be used for second axis of matrix.
             If not given, will be set to chain_i, resulting
             in a symmetric distance matrix
+        method : {"numba", "numpy", "cdist"}, optional (default: "numba")
+            Compute distances using jit-compiled loop over
+            atom pairs ("numba"), using vectorized numpy
+            operations on padded coordinate arrays ("numpy"),
+            or by computing all atom distances with
+            scipy.spatial.distance.cdist ("cdist")
+        max_dist : float, optional (default: None)
+            If given, residue pairs which are guaranteed to
+            be further apart than max_dist based on their
+            bounding spheres will be set to np.inf rather
+            than computing their exact distance. This is
+            much faster if only contacts are of interest,
+            but the resulting distance matrix should not be
+            used with larger distance cutoffs. Only
+            supported by method "numba" on device "cpu".
+        device : {"cpu", "cuda"}, optional (default: "cpu")
+            If "cuda", compute distances on a CUDA-capable
+            GPU (ignoring method). Small distance
+            maps (less than MIN_GPU_PAIRS residue pairs)
+            will still be computed on the CPU.
 
         Returns
         -------
         DistanceMap
             Distance map computed from given
             coordinates
+
+        Raises
+        ------
+        ValueError
+            If invalid method or device is given, or if
+            max_dist is given for a method or device
+            that does not support it
+        ResourceError
+            If device is "cuda", but no GPU is available
         """
-        ranges_i, coords_i = cls._extract_coords(chain_i.coords)
+        if method not in ("numba", "numpy", "cdist"):
+            raise ValueError(
+                "Invalid method for distance calculation: {}. "
+                "Valid options are: numba, numpy, cdist".format(method)
+            )
+
+        if device not in ("cpu", "cuda"):
+            raise ValueError(
+                "Invalid device for distance calculation: {}. "
+                "Valid options are: cpu, cuda".format(device)
+            )
+
+        if max_dist is not None and method != "numba":
+            raise ValueError(
+                "max_dist is not supported by method {}, "
+                "only by method numba".format(method)
+            )
+
+        if max_dist is not None and device == "cuda":
+            raise ValueError(
+                "max_dist is not supported for distance "
+                "calculation on device cuda"
+            )
+
+        if device == "cuda" and not cuda.is_available():
+            raise ResourceError(
+                "No CUDA-capable GPU available for distance calculation"
+            )
+
+        ranges_i, coords_i, centers_i, radii_i = cls._extract_coords(
+            chain_i.coords
+        )
 
         # if no second chain given, compute a symmetric distance
         # matrix (mainly relevant for intra-chain contacts)
@@ -203,15 +816,51 @@ class DistanceMap:
             ranges_j, coords_j = ranges_i, coords_i
         else:
             symmetric = False
-            ranges_j, coords_j = cls._extract_coords(chain_j.coords)
+            ranges_j, coords_j, centers_j, radii_j = cls._extract_coords(
+                chain_j.coords
+            )
 
-        # compute distances using jit-compiled function
-        dists = _distances(
-            ranges_i, coords_i,
-            ranges_j, coords_j,
-            symmetric
+        use_gpu = (
+            device == "cuda" and
+            len(ranges_i) * len(ranges_j) >= MIN_GPU_PAIRS
         )
 
+        if use_gpu:
+            dists = _distances_gpu(
+                ranges_i, coords_i,
+                ranges_j, coords_j
+            )
+        elif method == "numba":
+            if max_dist is None:
+                max_dist = np.inf
+
+            # compute squared distances using jit-compiled function
+            if symmetric:
+                # only upper triangle is computed, mirror
+                # to lower triangle (diagonal is zero)
+                dists = _distances_symmetric(
+                    ranges_i, coords_i, centers_i, radii_i, max_dist
+                )
+                dists += dists.T
+            else:
+                dists = _distances(
+                    ranges_i, coords_i, centers_i, radii_i,
+                    ranges_j, coords_j, centers_j, radii_j,
+                    max_dist
+                )
+
+            dists = np.sqrt(dists)
+        elif method == "numpy":
+            dists = _distances_vectorized(
+                ranges_i, coords_i,
+                ranges_j, coords_j
+            )
+        else:
+            dists = _distances_cdist(
+                ranges_i, coords_i,
+                ranges_j, coords_j
+            )
+
         # create distance matrix object
         return cls(
             chain_i.residues, chain_j.residues,
@@ -219,14 +868,26 @@ class DistanceMap:
         )
 
     @classmethod
-    def from_file(cls, filename):
+    def from_file(cls, filename, mmap=False):
         """
         Load existing distance map from file
 
         Parameters
         ----------
         filename : str
-            Path to distance map file
+            Path to distance map file (prefix of .csv and
+            .npz files; for uncompressed distance maps or
+            maps stored by previous versions, .csv and .npy
+            files). If both a .npz and a .npy file exist,
+            the more recently written one is loaded.
+        mmap : bool, optional (default: False)
+            Memory-map uncompressed (.npy) distance matrix
+            rather than reading it into memory, so only
+            entries that are actually accessed will be read
+            from disk. Compressed (.npz) distance matrices
+            are always read into memory. Distance matrices
+            read into memory are converted to float32, while
+            memory-mapped matrices keep their stored precision.
 
         Returns
         -------
@@ -243,8 +904,6 @@ class DistanceMap:
             }
         )
 
-        dist_matrix = np.load(filename + ".npy")
-
         if "axis" in residues.columns:
             symmetric = False
             residues_i = residues.query("axis == 'i'").drop("axis", axis=1)
@@ -254,11 +913,38 @@ class DistanceMap:
             residues_i = residues
             residues_j = residues
 
+        # to_file() only keeps one matrix file per prefix, but if
+        # both formats exist (e.g. files written by an older version),
+        # use the more recently written one
+        npz_file = filename + ".npz"
+        npy_file = filename + ".npy"
+
+        use_npz = path.exists(npz_file)
+        if use_npz and path.exists(npy_file):
+            use_npz = path.getmtime(npz_file) >= path.getmtime(npy_file)
+
+        if use_npz:
+            with np.load(npz_file) as data:
+                if "dist_triu" in data:
+                    # only upper triangle of symmetric matrix stored
+                    N = len(residues_i)
+                    i, j = np.triu_indices(N)
+                    values = data["dist_triu"].astype(np.float32)
+                    dist_matrix = np.zeros((N, N), dtype=np.float32)
+                    dist_matrix[i, j] = values
+                    dist_matrix[j, i] = values
+                else:
+                    dist_matrix = data["dist"].astype(np.float32)
+        elif mmap:
+            dist_matrix = np.load(npy_file, mmap_mode="r")
+        else:
+            dist_matrix = np.load(npy_file).astype(np.float32, copy=False)
+
         return cls(
             residues_i, residues_j, dist_matrix, symmetric
         )
 
-    def to_file(self, filename):
+    def to_file(self, filename, precision="float32", compress=True):
         """
         Store distance map in file
 
@@ -266,8 +952,31 @@ class DistanceMap:
         ----------
         filename : str
             Prefix of distance map files
-            (will create .csv and .npy file)
+            (will create .csv and .npz file)
+        precision : {"float32", "float16"}, optional (default: "float32")
+            Floating point precision used for storing
+            distances. float16 roughly halves the file size,
+            with rounding errors of up to 0.002 A for distances
+            below 8 A, and up to 0.016 A below 64 A.
+        compress : bool, optional (default: True)
+            Store distance matrix in compressed .npz file.
+            If False, store full matrix in uncompressed
+            .npy file instead, which can be memory-mapped
+            when loading (cf. from_file()). Any existing
+            matrix file in the other format with the same
+            prefix is removed.
+
+        Raises
+        ------
+        ValueError
+            If invalid precision is given
         """
+        if precision not in ("float32", "float16"):
+            raise ValueError(
+                "Invalid precision: {}. Valid options are: "
+                "float32, float16".format(precision)
+            )
+
         def _add_axis(df, axis):
             res = df.copy()
             res.loc[:, "axis"] = axis
@@ -278,13 +987,34 @@ class DistanceMap:
         else:
             res_i = _add_axis(self.residues_i, "i")
             res_j = _add_axis(self.residues_j, "j")
-            residues = res_i.append(res_j)
+            residues = pd.concat([res_i, res_j])
 
         # save residue table
         residues.to_csv(filename + ".csv", index=True)
 
-        # save distance matrix
-        np.save(filename + ".npy", self.dist_matrix)
+        # save compressed distance matrix; for symmetric
+        # matrices, only upper triangle has to be stored
+        if not compress:
+            matrix_file, stale_file = filename + ".npy", filename + ".npz"
+            np.save(matrix_file, self.dist_matrix.astype(precision))
+        elif self.symmetric:
+            matrix_file, stale_file = filename + ".npz", filename + ".npy"
+            dist_triu = self.dist_matrix[
+                np.triu_indices(len(self.residues_i))
+            ]
+            np.savez_compressed(
+                matrix_file, dist_triu=dist_triu.astype(precision)
+            )
+        else:
+            matrix_file, stale_file = filename + ".npz", filename + ".npy"
+            np.savez_compressed(
+                matrix_file, dist=self.dist_matrix.astype(precision)
+            )
+
+        # remove matrix stored in the other format under the same
+        # prefix, so from_file() cannot pick up an outdated matrix
+        if path.exists(stale_file):
+            os.remove(stale_file)
 
     def dist(self, i, j, raise_na=True):
         """
@@ -315,8 +1045,11 @@ class DistanceMap:
             for respective chain
         """
         # internally all identifiers are handled
-        # as strings, so convert
-        i, j = str(i), str(j)
+        # as strings, so convert if necessary
+        if not isinstance(i, str):
+            i = str(i)
+        if not isinstance(j, str):
+            j = str(j)
 
         # check if identifiers are valid for either axis
         if i not in self.id_map_i:
@@ -339,10 +1072,93 @@ class DistanceMap:
 
         # if valid, return distance of pair
         return self.dist_matrix[
-            self.id_map_i[i],
-            self.id_map_j[j]
+            self.id_map_i.get_loc(i),
+            self.id_map_j.get_loc(j)
         ]
 
+    def dists_bulk(self, ids_i, ids_j, raise_na=True):
+        """
+        Return distances of many residue pairs at once
+        (much faster than calling dist() for each pair)
+
+        Parameters
+        ----------
+        ids_i : list-like of int or str
+            Identifiers of positions on first axis
+        ids_j : list-like of int or str
+            Identifiers of positions on second axis
+            (same length as ids_i)
+        raise_na : bool, optional (default: True)
+            Raise error if any identifier is not
+            contained in its axis. If False, returns
+            np.nan for undefined entries.
+
+        Returns
+        -------
+        np.array
+            Distances of pairs (ids_i[k], ids_j[k]).
+            If raise_na is False, distances of pairs
+            with invalid identifiers will be np.nan
+
+        Raises
+        ------
+        KeyError
+            If any identifier in ids_i or ids_j is not a
+            valid identifier for respective chain
+        """
+        # internally all identifiers are handled
+        # as strings, so convert
+        ids_i = np.asarray(ids_i).astype(str)
+        ids_j = np.asarray(ids_j).astype(str)
+
+        # map to matrix indices in one go (-1 if not found)
+        idx_i = self.id_map_i.get_indexer(ids_i)
+        idx_j = self.id_map_j.get_indexer(ids_j)
+
+        invalid = (idx_i < 0) | (idx_j < 0)
+        if raise_na and invalid.any():
+            k = np.flatnonzero(invalid)[0]
+            if idx_i[k] < 0:
+                raise KeyError(
+                    "{} not contained in first axis of "
+                    "distance map".format(ids_i[k])
+                )
+            else:
+                raise KeyError(
+                    "{} not contained in second axis of "
+                    "distance map".format(ids_j[k])
+                )
+
+        dists = self.dist_matrix[idx_i, idx_j].astype(float)
+        dists[invalid] = np.nan
+
+        return dists
+
+    def dist_by_idx(self, i_idx, j_idx):
+        """
+        Return distance of residue pair(s) by their
+        index in the distance matrix, bypassing
+        identifier lookup.
+
+        For repeated lookups, resolve identifiers to
+        indices once (e.g. using
+        self.id_map_i.get_indexer(ids_i)) and use
+        this method in the inner loop.
+
+        Parameters
+        ----------
+        i_idx : int or np.array
+            Index (or indices) on first axis
+        j_idx : int or np.array
+            Index (or indices) on second axis
+
+        Returns
+        -------
+        np.float or np.array
+            Distance(s) of pair(s) (i_idx, j_idx)
+        """
+        return self.dist_matrix[i_idx, j_idx]
+
     def __getitem__(self, identifiers):
         """
         Parameters
@@ -585,7 +1401,7 @@ class DistanceMap:
         # later aggregtation
         new_mat = np.full(
             (len(matrices), len(new_res_i), len(new_res_j)),
-            np.nan
+            np.nan, dtype=np.float32
         )
 
         # put individual matrices into new indexing system
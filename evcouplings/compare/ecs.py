@@ -32,10 +32,9 @@ def add_distances(ec_table, dist_map, target_column="dist"):
     """
     ec_table = ec_table.copy()
 
-    ec_table.loc[:, target_column] = [
-        dist_map.dist(i, j, raise_na=False)
-        for i, j in zip(ec_table.i, ec_table.j)
-    ]
+    ec_table.loc[:, target_column] = dist_map.dists_bulk(
+        ec_table.i.values, ec_table.j.values, raise_na=False
+    )
 
     return ec_table
 
@@ -474,7 +474,7 @@ def standard(**kwargs):
         "pdb_structure_hits_file": prefix + "_structure_hits.csv",
         "pdb_structure_hits_unfiltered_file": prefix + "_structure_hits_unfiltered.csv",
         # cannot have the distmap files end with "_file" because there are
-        # two files (.npy and .csv), which would cause problems with automatic
+        # two files (.npz and .csv), which would cause problems with automatic
         # checking if those files exist
         "distmap_monomer": prefix + "_distance_map_monomer",
         "distmap_multimer": prefix + "_distance_map_multimer",
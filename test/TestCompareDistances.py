@@ -0,0 +1,551 @@
+"""
+Test cases for computing, storing and loading distance maps
+"""
+
+import os
+import tempfile
+import unittest
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from numba import cuda
+
+from evcouplings.compare.distances import (
+    DistanceMap, TILE_SIZE, _distances_gpu
+)
+from evcouplings.compare.ecs import add_distances
+from evcouplings.compare.pdb import Chain
+
+
+def _residues(ids, chain_index=0):
+    """
+    Create residue table of distance map axis
+    """
+    return pd.DataFrame({
+        "id": [str(i) for i in ids],
+        "seqres_id": [str(i) for i in ids],
+        "coord_id": [str(i) for i in ids],
+        "one_letter_code": "A",
+        "chain_index": chain_index,
+    })
+
+
+def _chain(atom_counts, seed, first_id=1, offset=0.0):
+    """
+    Create chain with random atom coordinates, where
+    residues follow a random walk in 3D space
+    """
+    rng = np.random.RandomState(seed)
+    N = len(atom_counts)
+
+    residues = _residues(range(first_id, first_id + N))
+    centers = np.cumsum(rng.normal(0, 2.5, (N, 3)), axis=0) + offset
+
+    residue_index = np.repeat(np.arange(N), atom_counts)
+    xyz = (
+        centers[residue_index] +
+        rng.normal(0, 1.5, (len(residue_index), 3))
+    )
+
+    coords = pd.DataFrame({
+        "residue_index": residue_index,
+        "atom_name": "CA",
+        "x": xyz[:, 0],
+        "y": xyz[:, 1],
+        "z": xyz[:, 2],
+    })
+
+    return Chain(residues, coords)
+
+
+def _brute_force_distances(chain_i, chain_j):
+    """
+    Reference minimum atom distances between all
+    residue pairs, computed in double precision
+    """
+    def _residue_coords(chain):
+        coords = chain.coords
+        return [
+            coords.loc[coords.residue_index == r, ["x", "y", "z"]].values
+            for r in range(len(chain.residues))
+        ]
+
+    xyz_i = _residue_coords(chain_i)
+    xyz_j = _residue_coords(chain_j)
+
+    dists = np.zeros((len(xyz_i), len(xyz_j)))
+    for i, a in enumerate(xyz_i):
+        for j, b in enumerate(xyz_j):
+            diff = a[:, np.newaxis, :] - b[np.newaxis, :, :]
+            dists[i, j] = np.sqrt((diff ** 2).sum(axis=-1).min())
+
+    return dists
+
+
+class TestDistanceCalculation(TestCase):
+
+    METHODS = ("numba", "numpy", "cdist")
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+
+        # chains spanning more than one tile of residues, with
+        # residues of a single atom and of more than four atoms
+        # (remainder of unrolled atom loop)
+        counts_i = rng.randint(1, 12, TILE_SIZE + 13)
+        counts_i[:3] = (1, 5, 11)
+        counts_j = rng.randint(1, 12, TILE_SIZE + 5)
+        counts_j[-2:] = (1, 7)
+
+        self.chain_i = _chain(counts_i, 1)
+        self.chain_j = _chain(counts_j, 2, first_id=101, offset=4.0)
+
+        self.ref_symmetric = _brute_force_distances(
+            self.chain_i, self.chain_i
+        )
+        self.ref_asymmetric = _brute_force_distances(
+            self.chain_i, self.chain_j
+        )
+
+    def test_symmetric(self):
+        """
+        Distances within one chain match brute-force reference
+        """
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                dist_map = DistanceMap.from_coords(
+                    self.chain_i, method=method
+                )
+                self.assertTrue(dist_map.symmetric)
+                np.testing.assert_allclose(
+                    dist_map.dist_matrix, self.ref_symmetric,
+                    rtol=0, atol=1e-4
+                )
+                np.testing.assert_array_equal(
+                    dist_map.dist_matrix, dist_map.dist_matrix.T
+                )
+
+    def test_asymmetric(self):
+        """
+        Distances between two chains match brute-force reference
+        """
+        for method in self.METHODS:
+            with self.subTest(method=method):
+                dist_map = DistanceMap.from_coords(
+                    self.chain_i, self.chain_j, method=method
+                )
+                self.assertFalse(dist_map.symmetric)
+                np.testing.assert_allclose(
+                    dist_map.dist_matrix, self.ref_asymmetric,
+                    rtol=0, atol=1e-4
+                )
+
+    @unittest.skipUnless(cuda.is_available(), "no CUDA GPU available")
+    def test_gpu(self):
+        """
+        Distances computed on GPU match brute-force reference (called
+        directly since from_coords() computes small maps on CPU)
+        """
+        ranges_i, coords_i, _, _ = DistanceMap._extract_coords(
+            self.chain_i.coords
+        )
+        ranges_j, coords_j, _, _ = DistanceMap._extract_coords(
+            self.chain_j.coords
+        )
+
+        np.testing.assert_allclose(
+            _distances_gpu(ranges_i, coords_i, ranges_j, coords_j),
+            self.ref_asymmetric, rtol=0, atol=1e-4
+        )
+
+    def test_max_dist(self):
+        """
+        Residue pairs skipped based on max_dist are set to inf,
+        while all pairs within max_dist have exact distances
+        """
+        max_dist = 6.0
+
+        for chain_j, ref in (
+            (None, self.ref_symmetric),
+            (self.chain_j, self.ref_asymmetric),
+        ):
+            with self.subTest(symmetric=chain_j is None):
+                dists = DistanceMap.from_coords(
+                    self.chain_i, chain_j, max_dist=max_dist
+                ).dist_matrix
+
+                culled = np.isinf(dists)
+                self.assertTrue(culled.any())
+
+                # only pairs beyond max_dist may be skipped
+                self.assertTrue(np.all(ref[culled] > max_dist))
+                self.assertTrue(np.all(np.isfinite(dists[ref <= max_dist])))
+
+                # all other pairs are computed exactly
+                np.testing.assert_allclose(
+                    dists[~culled], ref[~culled], rtol=0, atol=1e-4
+                )
+
+                # no culling without max_dist
+                np.testing.assert_array_equal(
+                    DistanceMap.from_coords(
+                        self.chain_i, chain_j, max_dist=None
+                    ).dist_matrix,
+                    DistanceMap.from_coords(self.chain_i, chain_j).dist_matrix
+                )
+
+    def test_max_dist_unsupported(self):
+        """
+        max_dist raises ValueError for methods and
+        devices that do not support it
+        """
+        for method in ("numpy", "cdist"):
+            with self.subTest(method=method):
+                with self.assertRaises(ValueError):
+                    DistanceMap.from_coords(
+                        self.chain_i, method=method, max_dist=6.0
+                    )
+
+        with self.assertRaises(ValueError):
+            DistanceMap.from_coords(
+                self.chain_i, device="cuda", max_dist=6.0
+            )
+
+    def test_extract_coords(self):
+        """
+        Residue atom ranges, centroids and radii describe
+        the atoms of each residue
+        """
+        ranges, xyz, centroids, radii = DistanceMap._extract_coords(
+            self.chain_i.coords
+        )
+
+        coords = self.chain_i.coords
+        for r, (first, count) in enumerate(ranges):
+            atoms = coords.loc[
+                coords.residue_index == r, ["x", "y", "z"]
+            ].values
+
+            np.testing.assert_allclose(
+                xyz[:, first:first + count].T, atoms, rtol=1e-6
+            )
+            np.testing.assert_allclose(
+                centroids[r], atoms.mean(axis=0), rtol=1e-6
+            )
+            np.testing.assert_allclose(
+                radii[r],
+                np.sqrt(((atoms - atoms.mean(axis=0)) ** 2).sum(axis=1)).max(),
+                rtol=1e-5, atol=1e-5
+            )
+
+    def test_extract_coords_unsorted(self):
+        """
+        Atoms not grouped by residue are sorted by residue,
+        keeping the order of atoms within each residue
+        """
+        coords = self.chain_i.coords
+        rng = np.random.RandomState(5)
+
+        # shuffle atom rows, but let atoms of each residue
+        # appear in their original relative order
+        keys = pd.Series(rng.rand(len(coords))).groupby(
+            coords.residue_index.values
+        ).transform(lambda k: np.sort(k.values))
+        shuffled = coords.iloc[np.argsort(keys.values)]
+        self.assertFalse(
+            np.all(np.diff(shuffled.residue_index.values) >= 0)
+        )
+
+        for ref_value, value in zip(
+            DistanceMap._extract_coords(coords),
+            DistanceMap._extract_coords(shuffled)
+        ):
+            np.testing.assert_allclose(value, ref_value, rtol=1e-6)
+
+        np.testing.assert_array_equal(
+            DistanceMap.from_coords(
+                Chain(self.chain_i.residues, shuffled),
+                self.chain_j
+            ).dist_matrix,
+            DistanceMap.from_coords(self.chain_i, self.chain_j).dist_matrix
+        )
+
+    def test_empty_chains(self):
+        """
+        Empty chains on either axis give empty distance matrices
+        """
+        empty = _chain([], 3)
+        single = _chain([3], 4)
+
+        for method in self.METHODS:
+            for chain_i, chain_j, shape in (
+                (single, empty, (1, 0)),
+                (empty, single, (0, 1)),
+                (empty, None, (0, 0)),
+            ):
+                with self.subTest(method=method, shape=shape):
+                    dist_map = DistanceMap.from_coords(
+                        chain_i, chain_j, method=method
+                    )
+                    self.assertEqual(dist_map.dist_matrix.shape, shape)
+
+    def test_invalid_method(self):
+        """
+        Invalid method or device raise ValueError
+        """
+        with self.assertRaises(ValueError):
+            DistanceMap.from_coords(self.chain_i, method="invalid")
+
+        with self.assertRaises(ValueError):
+            DistanceMap.from_coords(self.chain_i, device="invalid")
+
+
+class TestCompareDistances(TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(42)
+
+        # symmetric map of single chain
+        residues = _residues(range(1, 21))
+        dists = rng.uniform(0, 40, (20, 20)).astype(np.float32)
+        dists = np.triu(dists) + np.triu(dists, 1).T
+        self.symmetric_map = DistanceMap(residues, residues, dists, True)
+
+        # asymmetric map between two chains of different length
+        residues_i = _residues(range(1, 21))
+        residues_j = _residues(range(5, 35), chain_index=1)
+        self.asymmetric_map = DistanceMap(
+            residues_i, residues_j,
+            rng.uniform(0, 40, (20, 30)).astype(np.float32), False
+        )
+
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tempdir.name, "distmap")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _assert_round_trip(self, dist_map, loaded, precision):
+        """
+        Check that loaded distance map matches original one
+        """
+        self.assertEqual(loaded.symmetric, dist_map.symmetric)
+        self.assertEqual(loaded.dist_matrix.shape, dist_map.dist_matrix.shape)
+        self.assertListEqual(
+            list(loaded.residues_i.id), list(dist_map.residues_i.id)
+        )
+        self.assertListEqual(
+            list(loaded.residues_j.id), list(dist_map.residues_j.id)
+        )
+
+        # float16 only keeps about three significant digits
+        tolerance = 0.02 if precision == "float16" else 0
+        np.testing.assert_allclose(
+            loaded.dist_matrix, dist_map.dist_matrix, rtol=0, atol=tolerance
+        )
+
+    def test_round_trip(self):
+        """
+        Distance maps are restored for all combinations of storage
+        format, precision and memory-mapping when loading
+        """
+        for dist_map in (self.symmetric_map, self.asymmetric_map):
+            for compress in (True, False):
+                for precision in ("float32", "float16"):
+                    for mmap in (False, True):
+                        with self.subTest(
+                            symmetric=dist_map.symmetric, compress=compress,
+                            precision=precision, mmap=mmap
+                        ):
+                            dist_map.to_file(
+                                self.prefix, precision=precision,
+                                compress=compress
+                            )
+                            loaded = DistanceMap.from_file(
+                                self.prefix, mmap=mmap
+                            )
+                            self._assert_round_trip(
+                                dist_map, loaded, precision
+                            )
+
+                            # only uncompressed matrices can be mapped
+                            self.assertEqual(
+                                isinstance(loaded.dist_matrix, np.memmap),
+                                mmap and not compress
+                            )
+
+                            # matrices read into memory are always
+                            # float32, mapped ones keep stored precision
+                            self.assertEqual(
+                                loaded.dist_matrix.dtype,
+                                np.dtype(
+                                    precision if mmap and not compress
+                                    else np.float32
+                                )
+                            )
+                            del loaded
+
+    def test_overwrite_other_format(self):
+        """
+        Storing a map in one format removes a previously stored
+        matrix in the other format, so the new matrix is loaded
+        """
+        old_map = self.symmetric_map
+        new_map = DistanceMap(
+            old_map.residues_i, old_map.residues_j,
+            old_map.dist_matrix + 1, True
+        )
+
+        for compress_old, compress_new in ((True, False), (False, True)):
+            for mmap in (False, True):
+                with self.subTest(
+                    compress_old=compress_old, compress_new=compress_new,
+                    mmap=mmap
+                ):
+                    old_map.to_file(self.prefix, compress=compress_old)
+                    new_map.to_file(self.prefix, compress=compress_new)
+
+                    self.assertEqual(
+                        os.path.exists(self.prefix + ".npz"), compress_new
+                    )
+                    self.assertEqual(
+                        os.path.exists(self.prefix + ".npy"), not compress_new
+                    )
+
+                    loaded = DistanceMap.from_file(self.prefix, mmap=mmap)
+                    self._assert_round_trip(new_map, loaded, "float32")
+                    del loaded
+
+    def test_load_newest_format(self):
+        """
+        If both .npz and .npy matrix exist (e.g. .npy written by
+        previous versions), the more recent one is loaded
+        """
+        old_map = self.symmetric_map
+        new_map = DistanceMap(
+            old_map.residues_i, old_map.residues_j,
+            old_map.dist_matrix + 1, True
+        )
+
+        new_map.to_file(self.prefix)
+
+        # place outdated uncompressed matrix next to newer .npz
+        np.save(self.prefix + ".npy", old_map.dist_matrix)
+        mtime = os.path.getmtime(self.prefix + ".npz")
+        os.utime(self.prefix + ".npy", (mtime - 60, mtime - 60))
+
+        for mmap in (False, True):
+            with self.subTest(mmap=mmap):
+                loaded = DistanceMap.from_file(self.prefix, mmap=mmap)
+                self._assert_round_trip(new_map, loaded, "float32")
+
+    def test_duplicate_ids(self):
+        """
+        Residue identifiers occurring more than once
+        on either axis raise ValueError
+        """
+        residues = _residues([1, 2, 3, 2])
+        dists = np.zeros((4, 4), dtype=np.float32)
+
+        with self.assertRaises(ValueError):
+            DistanceMap(residues, residues, dists, True)
+
+        with self.assertRaises(ValueError):
+            DistanceMap(_residues(range(4)), residues, dists, False)
+
+    def test_dist(self):
+        """
+        Lookup by int or str identifier and by matrix
+        index give the same distance
+        """
+        dist_map = self.asymmetric_map
+
+        # residue 7 is at row 6, residue 12 at column 7
+        expected = dist_map.dist_matrix[6, 7]
+
+        self.assertEqual(dist_map.dist(7, 12), expected)
+        self.assertEqual(dist_map.dist("7", "12"), expected)
+        self.assertEqual(dist_map.dist(7, "12"), expected)
+        self.assertEqual(dist_map[7, 12], expected)
+        self.assertEqual(dist_map.dist_by_idx(6, 7), expected)
+
+        # index-based lookup of identifiers resolved in bulk
+        idx_i = dist_map.id_map_i.get_indexer(["7", "1"])
+        idx_j = dist_map.id_map_j.get_indexer(["12", "5"])
+        np.testing.assert_array_equal(
+            dist_map.dist_by_idx(idx_i, idx_j),
+            [expected, dist_map.dist(1, 5)]
+        )
+
+        with self.assertRaises(KeyError):
+            dist_map.dist(21, 12)
+
+        with self.assertRaises(KeyError):
+            dist_map.dist(7, 4)
+
+        self.assertTrue(np.isnan(dist_map.dist(7, 4, raise_na=False)))
+
+    def test_dists_bulk(self):
+        """
+        Bulk lookup of int and str identifiers gives
+        same distances as lookup of individual pairs
+        """
+        dist_map = self.asymmetric_map
+        ids_i = [1, "2", 20, "7", 3]
+        ids_j = ["5", 34, 10, "34", 5]
+
+        np.testing.assert_array_equal(
+            dist_map.dists_bulk(ids_i, ids_j),
+            [dist_map.dist(i, j) for i, j in zip(ids_i, ids_j)]
+        )
+
+        # invalid identifiers on either axis
+        invalid_i = ids_i + [21, 1]
+        invalid_j = ids_j + [5, 4]
+
+        with self.assertRaises(KeyError):
+            dist_map.dists_bulk(invalid_i, invalid_j)
+
+        for k in (-2, -1):
+            with self.assertRaises(KeyError):
+                dist_map.dists_bulk([invalid_i[k]], [invalid_j[k]])
+
+        dists = dist_map.dists_bulk(invalid_i, invalid_j, raise_na=False)
+        self.assertTrue(np.all(np.isnan(dists[-2:])))
+        np.testing.assert_array_equal(
+            dists[:-2], dist_map.dists_bulk(ids_i, ids_j)
+        )
+
+    def test_add_distances(self):
+        """
+        Distances added to EC table match lookup of individual pairs
+        """
+        ec_table = pd.DataFrame({
+            "i": [1, 3, 20, 21, 4, 15],
+            "j": [5, 34, 6, 8, 40, 12],
+            "cn": np.linspace(1, 0, 6),
+        })
+
+        for dist_map in (self.symmetric_map, self.asymmetric_map):
+            with self.subTest(symmetric=dist_map.symmetric):
+                ecs = add_distances(ec_table, dist_map)
+                np.testing.assert_array_equal(
+                    ecs.dist.values,
+                    [
+                        dist_map.dist(i, j, raise_na=False)
+                        for i, j in zip(ec_table.i, ec_table.j)
+                    ]
+                )
+                self.assertFalse("dist" in ec_table.columns)
+
+    def test_invalid_precision(self):
+        """
+        Storing with invalid precision raises ValueError
+        """
+        with self.assertRaises(ValueError):
+            self.symmetric_map.to_file(self.prefix, precision="float64")
+
+
+if __name__ == '__main__':
+    unittest.main()